@@ -1,31 +1,74 @@
 from __future__ import annotations
 
+from pathlib import Path
 from typing import Any
+import asyncio
 import json
+import os
 import time
 import hmac
 import hashlib
 import base64
+import multiprocessing
+import shutil
 import urllib.parse
-from datetime import datetime
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from wsgiref.handlers import format_date_time
 
 # 引入 WebSocket 库
 import websockets
 import numpy as np
-from fastapi import FastAPI, File, HTTPException, UploadFile, status
+import orjson
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from sklearn.metrics.pairwise import cosine_similarity
 
-from clustering import cluster_palette, fallback_pos
+from clustering import cluster_palette, fallback_pos, knn_search
+from edges_numba import select_edges
 # 引入新配置
 from config import FILES_DIR, SPARK_APP_ID, SPARK_API_SECRET, SPARK_API_KEY, SPARK_WS_URL, SPARK_DOMAIN
 from text_processing import safe_stem
 
 import openai
 
+# 论文数达到该阈值时，近邻检索放到独立进程中执行，避免 GIL 串行化并发请求
+PROCESS_POOL_MIN_PAPERS = 2000
+_process_pool: ProcessPoolExecutor | None = None
+
+
+# Ollama 客户端全局复用，底层 HTTP 连接池在多次提问之间保持长连接
+_llm_client: openai.AsyncOpenAI | None = None
+
+
+def _get_llm_client() -> openai.AsyncOpenAI:
+    global _llm_client
+    if _llm_client is None:
+        # Ollama 默认运行在 11434 端口
+        _llm_client = openai.AsyncOpenAI(
+            api_key="ollama",
+            base_url="http://localhost:11434/v1"
+        )
+    return _llm_client
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        # 本进程是多线程的（uvicorn 线程池、joblib、torch/OpenMP），fork 之后子进程里再调 FAISS 可能卡死，改用 spawn
+        _process_pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    return _process_pool
+
+
+def _reset_process_pool() -> None:
+    global _process_pool
+    pool, _process_pool = _process_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
 class AnalyzeBody(BaseModel):
     vectors: list[list[float]] | None = None
 
@@ -33,14 +76,24 @@ class ChatBody(BaseModel):
     question: str
 
 
+# 签名只依赖到秒级的时间戳，同一秒内的请求复用已生成的 URL
+_auth_cache: dict[tuple[int, str, str, str], str] = {}
+
+
 # --- 辅助函数：生成 WebSocket 鉴权 URL ---
 def get_auth_url(host_url, api_key, api_secret):
+    now = int(time.time())
+    key = (now, host_url, api_key, api_secret)
+    cached = _auth_cache.get(key)
+    if cached is not None:
+        return cached
+
     ul = urllib.parse.urlparse(host_url)
     hostname = ul.hostname
     path = ul.path
 
     # 生成 RFC1123 格式的时间戳
-    date = format_date_time(time.mktime(datetime.now().timetuple()))
+    date = format_date_time(now)
 
     # 拼接签名字符串
     signature_origin = f"host: {hostname}\ndate: {date}\nGET {path} HTTP/1.1"
@@ -63,15 +116,94 @@ def get_auth_url(host_url, api_key, api_secret):
         "date": date,
         "host": hostname
     }
-    return host_url + '?' + urllib.parse.urlencode(v)
+    url = host_url + '?' + urllib.parse.urlencode(v)
+
+    # 淘汰过期的签名
+    for k in [k for k in _auth_cache if k[0] != now]:
+        del _auth_cache[k]
+    _auth_cache[key] = url
+    return url
+
+
+def _build_edges(
+    ids: list[str], clusters: np.ndarray, nbr_sims: np.ndarray, nbr_idx: np.ndarray, threshold: float = 0.20
+) -> list[dict[str, Any]]:
+    src, dst, w, same = select_edges(nbr_sims, nbr_idx, clusters, threshold)
+    return [
+        {"source": ids[i], "target": ids[j], "weight": wt, "type": "intra" if s else "bridge"}
+        for i, j, wt, s in zip(src.tolist(), dst.tolist(), w.tolist(), same.tolist())
+    ]
+
+
+# --- /api/query 以 Server-Sent Events 流式返回 ---
+# 事件：cites（引用的论文 id 列表）、delta（增量文本）、error、done；data 均为 JSON
+def _sse(event: str, data: Any) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+async def _sse_answer(text: str, cites: list[str] | None = None):
+    yield _sse("cites", cites or [])
+    yield _sse("delta", text)
+    yield _sse("done", None)
+
+
+def _sse_response(events) -> StreamingResponse:
+    return StreamingResponse(events, media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+def _save_stream(src, dest: Path) -> None:
+    with dest.open("wb") as out:
+        shutil.copyfileobj(src, out, length=1024 * 1024)
+
+
+_DEFAULT_COLOR = cluster_palette()[0]
+
+
+def _display_stem(filename: str, stem_cache: dict[str, str]) -> str:
+    stem = stem_cache.get(filename)
+    if stem is None:
+        stem = stem_cache[filename] = safe_stem(filename)
+    return stem
+
+
+def _build_paper(p: dict[str, Any], default_color: str, stem_cache: dict[str, str]) -> dict[str, Any]:
+    paper_id = str(p.get("id") or "")
+    pos = p.get("pos")
+    if not isinstance(pos, (list, tuple)) or len(pos) < 3:
+        pos = fallback_pos(paper_id)
+    return {
+        "id": paper_id,
+        "title": str(p.get("title", "Untitled")),
+        "displayTitle": str(p.get("display_title") or _display_stem(str(p.get("filename") or ""), stem_cache)),
+        "firstSentence": str(p.get("first_sentence") or p.get("abstract", "")[:120] or "No content available."),
+        "abstract": str(p.get("abstract", "")),
+        "filename": str(p.get("filename", "")),
+        "field": str(p.get("field", "Uncategorized")),
+        "confidence": p.get("confidence", 0.0),
+        "size": p.get("size", 3.0),
+        "pos": pos[:3],
+        "color": str(p.get("color", default_color)),
+        "keywords": p.get("keywords", []),
+        "cluster": int(p.get("cluster", 0)),
+    }
 
 
 def create_app(store) -> FastAPI:
+    # /api/papers 自行用 orjson 编码并缓存响应体；其余路由返回的都是原生 Python 类型，用默认的 JSONResponse 即可
     app = FastAPI()
 
     @app.on_event("startup")
     def _startup_ingest() -> None:
-        store.ingest_from_inbox()
+        if store.ingest_from_inbox():
+            return
+        # 没有新文件时不会重算；若加载时向量被丢弃（换了模型），这里补一次重算，否则连边和检索一直为空
+        with store._lock:
+            needs_recompute = bool(store._papers) and store._vectors is None
+        if needs_recompute:
+            try:
+                store._recompute()
+            except Exception as e:
+                print(f"Failed to re-encode papers on startup: {e}")
 
     app.add_middleware(
         CORSMiddleware,
@@ -81,83 +213,125 @@ def create_app(store) -> FastAPI:
         allow_headers=["*"],
     )
 
+    def _refresh_edges() -> None:
+        # 1. 持锁拿快照；向量数组只会整体替换、不会原地修改，出锁后可安全读取
+        with store._lock:
+            if not store._edges_dirty:
+                return
+            version = store._data_version
+            n = len(store._papers)
+            V, V_i8 = store._vectors_norm, store._vectors_i8
+            if V is not None and len(V) != n:
+                # 入库中途 papers 与 vectors 尚未同步，保留旧连边，等重算后再次触发
+                return
+            store._edges_dirty = False
+            if n < 2 or V is None:
+                store._edges = []
+                store._papers_bytes = None
+                return
+            ids = [str(p.get("id") or "") for p in store._papers]
+            clusters = np.fromiter((int(p.get("cluster", 0)) for p in store._papers), dtype=np.int32, count=n)
+
+        # 2. 不持锁计算近邻与连边
+        topk = min(4, n - 1)
+        try:
+            if n >= PROCESS_POOL_MIN_PAPERS:
+                try:
+                    nbr_sims, nbr_idx = _get_process_pool().submit(knn_search, V, topk, V_i8).result()
+                except BrokenProcessPool:
+                    # 子进程挂了（OOM 等）时进程池不可再用：丢弃它，下次重新创建，本次在进程内计算
+                    _reset_process_pool()
+                    nbr_sims, nbr_idx = knn_search(V, topk, V_i8)
+            else:
+                nbr_sims, nbr_idx = knn_search(V, topk, V_i8)
+            edges = _build_edges(ids, clusters, nbr_sims, nbr_idx)
+        except Exception as e:
+            print(f"Error computing edges: {e}")
+            edges = []
+
+        # 3. 数据在计算期间没有变化才替换快照
+        with store._lock:
+            if store._data_version == version:
+                store._edges = edges
+                store._papers_bytes = None
+
+    edge_event = asyncio.Event()
+    edge_task: asyncio.Task | None = None
+
+    async def _edge_worker() -> None:
+        while True:
+            await edge_event.wait()
+            edge_event.clear()
+            await asyncio.to_thread(_refresh_edges)
+
+    @app.on_event("startup")
+    async def _start_edge_worker() -> None:
+        nonlocal edge_task
+        loop = asyncio.get_running_loop()
+        store._edges_notify = lambda: loop.call_soon_threadsafe(edge_event.set)
+        edge_event.set()
+        edge_task = asyncio.create_task(_edge_worker())
+
+    @app.on_event("shutdown")
+    async def _shutdown_background() -> None:
+        store._edges_notify = None
+        if edge_task is not None:
+            edge_task.cancel()
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+
     @app.get("/api/health")
-    def api_health() -> dict[str, Any]:
+    async def api_health() -> dict[str, Any]:
         return {"ok": True}
 
-    @app.get("/api/papers")
-    def api_papers() -> dict[str, Any]:
+    def _papers_payload() -> bytes:
         with store._lock:
-            if store._papers and any(("pos" not in p) or ("cluster" not in p) for p in store._papers):
-                store._recompute_locked()
-
-            papers: list[dict[str, Any]] = []
-            for p in store._papers:
-                paper_id = str(p.get("id") or "")
-                pos = p.get("pos")
-                if not isinstance(pos, (list, tuple)) or len(pos) < 3:
-                    pos = fallback_pos(paper_id)
-                papers.append(
-                    {
-                        "id": paper_id,
-                        "title": str(p.get("title", "Untitled")),
-                        "displayTitle": str(p.get("display_title") or safe_stem(str(p.get("filename") or ""))),
-                        "firstSentence": str(p.get("first_sentence") or p.get("abstract", "")[:120] or "No content available."),
-                        "abstract": str(p.get("abstract", "")),
-                        "filename": str(p.get("filename", "")),
-                        "field": str(p.get("field", "Uncategorized")),
-                        "confidence": float(p.get("confidence", 0.0)),
-                        "size": float(p.get("size", 3.0)),
-                        "pos": (float(pos[0]), float(pos[1]), float(pos[2])),
-                        "color": str(p.get("color", cluster_palette()[0])),
-                        "keywords": p.get("keywords", []),
-                        "cluster": int(p.get("cluster", 0)),
-                    }
-                )
+            stale = any(("pos" not in p) or ("cluster" not in p) for p in store._papers)
+        if stale:
+            store._recompute()
+        with store._lock:
+            if store._papers_bytes is not None:
+                return store._papers_bytes
 
-            edges: list[dict[str, Any]] = []
-            if store._vectors is not None and len(store._papers) >= 2:
-                try:
-                    sims = cosine_similarity(store._vectors)
-                    np.fill_diagonal(sims, 0.0)
-                    used: set[tuple[str, str]] = set()
-                    topk = min(4, len(store._papers) - 1)
-                    for i, pi in enumerate(store._papers):
-                        src = str(pi.get("id") or "")
-                        order = np.argsort(sims[i])[::-1][:topk]
-                        for j in order:
-                            w = float(sims[i, j])
-                            if w < 0.20: continue
-                            dst = str(store._papers[int(j)].get("id") or "")
-                            a, b = (src, dst) if src <= dst else (dst, src)
-                            if (a, b) in used: continue
-                            used.add((a, b))
-                            t = "intra" if int(pi.get("cluster", 0)) == int(store._papers[int(j)].get("cluster", 0)) else "bridge"
-                            edges.append({"source": src, "target": dst, "weight": w, "type": t})
-                except Exception as e:
-                    print(f"Error computing edges: {e}")
-                    edges = []
-
-        return {"papers": papers, "edges": edges}
+            papers = [_build_paper(p, _DEFAULT_COLOR, store._stem_cache) for p in store._papers]
+
+            # 连边来自后台任务的快照；快照过期时照常返回，但不缓存响应体
+            edges = store._edges
+            payload = orjson.dumps({"papers": papers, "edges": edges or []}, option=orjson.OPT_SERIALIZE_NUMPY)
+            if edges is not None and not store._edges_dirty:
+                store._papers_bytes = payload
+            return payload
+
+    @app.get("/api/papers")
+    async def api_papers() -> Response:
+        payload = await asyncio.to_thread(_papers_payload)
+        return Response(content=payload, media_type="application/json")
 
     @app.get("/api/pdfs")
-    def api_pdfs() -> dict[str, Any]:
-        return {"pdfs": store.list_pdfs()}
+    async def api_pdfs() -> dict[str, Any]:
+        # list_pdfs 需要拿锁，重算期间可能阻塞，放到线程里等待
+        pdfs = await asyncio.to_thread(store.list_pdfs)
+        return {"pdfs": pdfs}
 
     @app.post("/api/scan")
-    def api_scan() -> dict[str, Any]:
-        count = store.ingest_from_inbox()
-        return {"added": count, "total": len(store.list_pdfs())}
+    async def api_scan() -> dict[str, Any]:
+        count = await asyncio.to_thread(store.ingest_from_inbox)
+        pdfs = await asyncio.to_thread(store.list_pdfs)
+        return {"added": count, "total": len(pdfs)}
 
     @app.post("/api/upload")
     async def api_upload(file: UploadFile = File(...)) -> dict[str, Any]:
         if not file.filename or not file.filename.lower().endswith(".pdf"):
             raise HTTPException(status_code=400, detail="Only .pdf files are supported")
-        raw = await file.read()
-        if not raw:
-            raise HTTPException(status_code=400, detail="Empty file")
+        # 直接把上传流落盘，不在内存里拼出整个文件
+        tmp_path = FILES_DIR / f"upload-{uuid.uuid4().hex}.part"
         try:
-            pdf_id = store.add_pdf(file.filename, raw)
+            await asyncio.to_thread(_save_stream, file.file, tmp_path)
+            if tmp_path.stat().st_size == 0:
+                raise HTTPException(status_code=400, detail="Empty file")
+            pdf_id = await asyncio.to_thread(store.add_pdf, file.filename, tmp_path)
+        except HTTPException:
+            raise
         except ValueError as e:
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
         except RuntimeError as e:
@@ -165,6 +339,8 @@ def create_app(store) -> FastAPI:
         except Exception as e:
             print(f"Upload failed: {e}")
             raise HTTPException(status_code=500, detail="Internal server error")
+        finally:
+            tmp_path.unlink(missing_ok=True)
         return {"success": True, "pdf_id": pdf_id}
 
     @app.post("/api/papers/upload")
@@ -172,19 +348,19 @@ def create_app(store) -> FastAPI:
         return await api_upload(file)
 
     @app.post("/api/analyze")
-    def api_analyze(body: AnalyzeBody) -> dict[str, Any]:
-        return store.analyze()
+    async def api_analyze(body: AnalyzeBody) -> dict[str, Any]:
+        return await asyncio.to_thread(store.analyze)
 
     # --- 核心修改：使用 Ollama AI 大模型 ---
     @app.post("/api/query")
-    async def api_query(body: ChatBody) -> dict[str, Any]:
+    async def api_query(body: ChatBody) -> StreamingResponse:
         question = body.question.strip()
         if not question:
-            return {"answer": "请输入您的问题。", "cites": []}
+            return _sse_response(_sse_answer("请输入您的问题。"))
 
         #  1. 检索阶段
         # 调用在 store.py 里写的搜索方法
-        related_papers = store.search_similar_papers(question, top_k=3)
+        related_papers = await asyncio.to_thread(store.search_similar_papers, question, 3)
 
         if not related_papers:
             context = "未在本地库中找到相关论文。请根据你的知识尝试回答。"
@@ -197,11 +373,7 @@ def create_app(store) -> FastAPI:
             context = "\n\n".join(context_segments)
 
         # 2. 本地生成阶段 (Ollama)
-        # Ollama 默认运行在 11434 端口
-        client = openai.OpenAI(
-            api_key="ollama",
-            base_url="http://localhost:11434/v1"
-        )
+        client = _get_llm_client()
 
         prompt = f"""你是一个专业的论文分析助手。请基于以下提供的参考资料，用简洁专业的语言回答用户的问题。
     如果参考资料中没有相关信息，请直接说明。
@@ -213,42 +385,53 @@ def create_app(store) -> FastAPI:
     {question}
     """
 
-        try:
-            # 已经下载好的 qwen2.5:3b
-            response = client.chat.completions.create(
-                model="qwen2.5:3b",
-                messages=[
-                    {"role": "system", "content": "你是一个严谨的学术助手。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-            )
-
-            answer = response.choices[0].message.content
-
-            # 返回回答和引用的论文 ID，前端星系会高亮这些论文
-            return {
-                "answer": answer,
-                "cites": [p["id"] for p in related_papers]
-            }
+        async def gen():
+            # 先返回引用的论文 ID，前端星系会高亮这些论文
+            yield _sse("cites", [p["id"] for p in related_papers])
+            try:
+                # 已经下载好的 qwen2.5:3b
+                response = await client.chat.completions.create(
+                    model="qwen2.5:3b",
+                    messages=[
+                        {"role": "system", "content": "你是一个严谨的学术助手。"},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.3,
+                    stream=True,
+                )
+                async for chunk in response:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield _sse("delta", chunk.choices[0].delta.content)
+            except Exception as e:
+                print(f"Ollama Error: {e}")
+                yield _sse("error", f"本地 AI 响应失败，请确保 Ollama 已启动。错误: {str(e)}")
+            yield _sse("done", None)
 
-        except Exception as e:
-            print(f"Ollama Error: {e}")
-            return {"answer": f"本地 AI 响应失败，请确保 Ollama 已启动。错误: {str(e)}", "cites": []}
+        return _sse_response(gen())
 
     @app.get("/files/{paper_id}.pdf")
-    def api_files(paper_id: str) -> FileResponse:
+    async def api_files(paper_id: str, request: Request) -> Response:
         pdf_path = FILES_DIR / f"{paper_id}.pdf"
-        if not pdf_path.exists():
+        try:
+            st = os.stat(pdf_path)
+        except FileNotFoundError:
             raise HTTPException(status_code=404, detail="PDF not found")
-        return FileResponse(
-            str(pdf_path),
+
+        # 文件按 id 只写一次，mtime + size 足以作为 ETag，重复打开阅读器时可直接返回 304
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        response = FileResponse(
+            pdf_path,
             media_type="application/pdf",
-            headers={"Content-Disposition": f"inline; filename=\"{paper_id}.pdf\""},
+            stat_result=st,
+            headers={"Content-Disposition": f"inline; filename=\"{paper_id}.pdf\"", "ETag": etag},
         )
+        response.chunk_size = 1024 * 1024
+        return response
 
     @app.get("/api/visualization")
-    def api_visualization() -> dict[str, Any]:
-        return store.visualization()
+    async def api_visualization() -> dict[str, Any]:
+        return await asyncio.to_thread(store.visualization)
 
     return app
\ No newline at end of file
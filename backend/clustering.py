@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import hashlib
+from functools import lru_cache
 
 import numpy as np
 from sklearn.decomposition import PCA
@@ -10,31 +11,145 @@ try:
 except ImportError:
     umap = None
 
+try:
+    import cuml
+except ImportError:
+    cuml = None
+
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
 
-def cluster_palette() -> list[str]:
-    return [
-        "#60a5fa",
-        "#f59e0b",
-        "#10b981",
-        "#a78bfa",
-        "#f472b6",
-        "#22c55e",
-        "#38bdf8",
-        "#fb7185",
-        "#eab308",
-        "#14b8a6",
-    ]
+try:
+    import faiss
+except ImportError:
+    faiss = None
 
 
-def fallback_pos(paper_id: str) -> list[float]:
-    h = hashlib.sha1((paper_id or "").encode("utf-8")).digest()
+_PALETTE = (
+    "#60a5fa",
+    "#f59e0b",
+    "#10b981",
+    "#a78bfa",
+    "#f472b6",
+    "#22c55e",
+    "#38bdf8",
+    "#fb7185",
+    "#eab308",
+    "#14b8a6",
+)
+
+
+def cluster_palette() -> tuple[str, ...]:
+    return _PALETTE
+
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    v = np.array(vectors, dtype=np.float32, order="C")
+    v /= np.linalg.norm(v, axis=1, keepdims=True).clip(1e-12)
+    return v
+
+
+def quantize_i8(vectors_norm: np.ndarray) -> np.ndarray:
+    # 只分配一个中间数组，round/clip 都原地进行
+    q = vectors_norm * 127
+    np.rint(q, out=q)
+    np.clip(q, -128, 127, out=q)
+    return q.astype(np.int8)
+
+
+def cosine_sim_matrix(vectors_norm: np.ndarray, vectors_i8: np.ndarray | None = None) -> np.ndarray:
+    if simsimd is not None:
+        # int8 向量只有在 SimSIMD 可用时才参与计算，numpy 的 int8 矩阵乘会溢出
+        V = vectors_i8 if vectors_i8 is not None else vectors_norm
+        sims = 1.0 - np.asarray(simsimd.cdist(V, V, metric="cosine"))
+    else:
+        sims = vectors_norm @ vectors_norm.T
+    np.fill_diagonal(sims, 0.0)
+    return sims
+
+
+def knn_search(
+    vectors_norm: np.ndarray, topk: int, vectors_i8: np.ndarray | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """返回每个向量最相似的 topk 个邻居（不含自身）的 (相似度, 下标)"""
+    n = vectors_norm.shape[0]
+    if faiss is not None:
+        index = faiss.IndexFlatIP(vectors_norm.shape[1])
+        index.add(vectors_norm)
+        D, I = index.search(vectors_norm, topk + 1)
+        is_self = I == np.arange(n)[:, None]
+        # 存在完全重复的向量时自身可能不在结果中，此时丢弃最后一列
+        is_self[~is_self.any(axis=1), -1] = True
+        keep = ~is_self
+        return D[keep].reshape(n, topk), I[keep].reshape(n, topk)
+
+    sims = cosine_sim_matrix(vectors_norm, vectors_i8)
+    return top_k_desc(sims, topk)
+
+
+def top_k_desc(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """沿最后一维取最大的 k 个 (值, 下标)，按值降序；O(N) 分区后只排序选中的 k 个"""
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k < n:
+        idx = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        idx = np.broadcast_to(np.arange(n), scores.shape)
+    vals = np.take_along_axis(scores, idx, axis=-1)
+    order = np.argsort(-vals, axis=-1, kind="stable")
+    return np.take_along_axis(vals, order, axis=-1), np.take_along_axis(idx, order, axis=-1)
+
+
+@lru_cache(maxsize=4096)
+def _hashed_pos(paper_id: str) -> tuple[float, float, float]:
+    h = hashlib.sha1(paper_id.encode("utf-8")).digest()
     a = int.from_bytes(h[0:4], "little", signed=False) / 2**32
     b = int.from_bytes(h[4:8], "little", signed=False) / 2**32
     c = int.from_bytes(h[8:12], "little", signed=False) / 2**32
     x = (a - 0.5) * 14.0
     y = (b - 0.5) * 14.0
     z = (c - 0.5) * 14.0
-    return [float(x), float(y), float(z)]
+    return (float(x), float(y), float(z))
+
+
+def fallback_pos(paper_id: str) -> list[float]:
+    # 同一 id 每次请求都会重复哈希，缓存结果；返回新 list 以免调用方改动缓存
+    return list(_hashed_pos(paper_id or ""))
+
+
+# 样本数低于该值时直接用 PCA，UMAP 的近邻图 + SGD 开销不划算
+UMAP_MIN_SAMPLES = 200
+# 样本数不超过该值时直接对中心化矩阵做一次 SVD 投影到前 3 个主轴，不经过 sklearn
+SVD_MAX_SAMPLES = 32
+
+
+def _umap_fit_transform(vectors: np.ndarray) -> np.ndarray | None:
+    n = vectors.shape[0]
+    params = dict(n_components=3, n_neighbors=min(10, n - 1), min_dist=0.12, random_state=42)
+    if cuml is not None:
+        try:
+            return cuml.UMAP(**params, output_type="numpy").fit_transform(vectors)
+        except Exception:
+            pass
+    if umap is not None:
+        try:
+            # random_state 固定时 umap 会强制单线程，这里保留它以保证布局可复现
+            return umap.UMAP(**params, init="spectral", low_memory=False).fit_transform(vectors)
+        except Exception:
+            pass
+    return None
+
+
+def _svd_project_3d(vectors: np.ndarray) -> np.ndarray:
+    X = vectors - vectors.mean(axis=0, keepdims=True)
+    U, S, _ = np.linalg.svd(X, full_matrices=False)
+    coords = np.zeros((X.shape[0], 3), dtype=np.float32)
+    # 样本数或维度不足 3 时主轴不够，剩余坐标补 0
+    m = min(3, S.size)
+    coords[:, :m] = U[:, :m] * S[:m]
+    return coords
 
 
 def reduce_to_3d(vectors: np.ndarray) -> np.ndarray:
@@ -43,25 +158,20 @@ def reduce_to_3d(vectors: np.ndarray) -> np.ndarray:
         return np.zeros((1, 3), dtype=np.float32)
 
     coords: np.ndarray | None = None
-    if umap is not None and n >= 5:
-        try:
-            reducer = umap.UMAP(
-                n_components=3,
-                n_neighbors=min(10, n - 1),
-                min_dist=0.12,
-                init="random" if n < 10 else "spectral",
-                random_state=42,
-            )
-            coords = reducer.fit_transform(vectors)
-        except Exception:
-            coords = None
+    if n <= SVD_MAX_SAMPLES:
+        coords = _svd_project_3d(vectors)
+    elif n >= UMAP_MIN_SAMPLES:
+        coords = _umap_fit_transform(vectors)
 
     if coords is None:
         pca = PCA(n_components=3, random_state=42)
         coords = pca.fit_transform(vectors)
 
-    coords = coords - coords.mean(axis=0, keepdims=True)
-    max_abs = float(np.max(np.abs(coords))) if coords.size else 1.0
+    # 原地居中并缩放到 [-5.5, 5.5]；coords 都是上面新建的数组，已是 float32 时无需再拷贝
+    coords = np.asarray(coords, dtype=np.float32)
+    coords -= coords.mean(axis=0, keepdims=True)
+    max_abs = float(np.abs(coords).max()) if coords.size else 1.0
     if max_abs < 1e-6:
         max_abs = 1.0
-    return (coords / max_abs * 5.5).astype(np.float32)
+    coords *= 5.5 / max_abs
+    return coords
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _select_edges_loop(
+    nbr_sims: np.ndarray, nbr_idx: np.ndarray, clusters: np.ndarray, threshold: float
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    n, topk = nbr_idx.shape
+    src = np.empty(n * topk, dtype=np.int64)
+    dst = np.empty(n * topk, dtype=np.int64)
+    weight = np.empty(n * topk, dtype=np.float64)
+    same = np.empty(n * topk, dtype=np.bool_)
+    m = 0
+    for i in range(n):
+        for t in range(topk):
+            j = nbr_idx[i, t]
+            w = nbr_sims[i, t]
+            if w < threshold or j == i:
+                continue
+            # j < i 时，若第 j 行的近邻里已有 i，则这条边在处理第 j 行时已经输出过
+            if j < i:
+                dup = False
+                for u in range(topk):
+                    if nbr_idx[j, u] == i and nbr_sims[j, u] >= threshold:
+                        dup = True
+                        break
+                if dup:
+                    continue
+            src[m] = i
+            dst[m] = j
+            weight[m] = w
+            same[m] = clusters[i] == clusters[j]
+            m += 1
+    return src[:m], dst[:m], weight[:m], same[:m]
+
+
+def _select_edges_numpy(
+    nbr_sims: np.ndarray, nbr_idx: np.ndarray, clusters: np.ndarray, threshold: float
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    n, topk = nbr_idx.shape
+    src = np.repeat(np.arange(n), topk)
+    dst = nbr_idx.ravel().astype(np.int64, copy=False)
+    w = nbr_sims.ravel()
+    keep = (w >= threshold) & (src != dst)
+    src, dst, w = src[keep], dst[keep], w[keep]
+
+    # 无向去重：下三角的候选 (i, j), j < i，若第 j 行的近邻里已有 i，则该边已由第 j 行输出
+    lower = dst < src
+    back = (nbr_idx[dst[lower]] == src[lower, None]) & (nbr_sims[dst[lower]] >= threshold)
+    keep = np.ones(src.shape, dtype=bool)
+    keep[lower] = ~back.any(axis=1)
+    src, dst, w = src[keep], dst[keep], w[keep]
+    return src, dst, w, clusters[src] == clusters[dst]
+
+
+# 返回 (src, dst, weight, same_cluster) 四个扁平数组；有 numba 时走 JIT 循环，否则走 NumPy 向量化版本
+select_edges = njit(cache=True)(_select_edges_loop) if njit is not None else _select_edges_numpy
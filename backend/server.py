@@ -2,10 +2,11 @@ import os
 
 import uvicorn
 
-import main
-
 
 def main_entry() -> None:
+    # 放在函数内：spawn 的子进程会以 __mp_main__ 重新执行本文件，顶层导入会让每个子进程都构建一遍 ScholarStore
+    import main
+
     host = os.getenv("HOST", "127.0.0.1")
     port = int(os.getenv("PORT", "8000"))
     uvicorn.run(main.app, host=host, port=port, log_level="info")
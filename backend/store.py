@@ -1,55 +1,233 @@
 from __future__ import annotations
 
-import json
+import hashlib
+import multiprocessing
 import os
 # 设置 HF 镜像以解决国内连接问题
 os.environ['HF_ENDPOINT'] = 'https://hf-mirror.com'
 
+import shutil
 import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
 from threading import Lock
-from typing import Any
+from typing import Any, Callable
 
 import numpy as np
-from sklearn.cluster import KMeans
+import orjson
+from joblib import Parallel, delayed
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.metrics import calinski_harabasz_score, silhouette_score
-from sklearn.metrics.pairwise import cosine_similarity
 
 try:
     from sentence_transformers import SentenceTransformer
 except ImportError:
     SentenceTransformer = None
 
-from config import FILES_DIR, INBOX_DIR, PAPERS_JSON
-from clustering import cluster_palette, reduce_to_3d
-from text_processing import (
-    clean_text,
-    extract_abstract_block,
-    extract_keywords_block,
-    extract_title_from_text,
-    read_pdf_text,
-    safe_stem,
-    tfidf_keywords_block,
-)
+try:
+    from fast_sentence_transformers import FastSentenceTransformer
+except ImportError:
+    FastSentenceTransformer = None
+
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
+
+from config import FILES_DIR, INBOX_DIR, PAPERS_JSON, VECTORS_NPY
+from clustering import cluster_palette, l2_normalize, quantize_i8, reduce_to_3d, top_k_desc
+from text_processing import parse_pdf
+
+
+# 编码批大小；按文本长度排序后分批，减少 padding 带来的无效计算
+ENCODE_BATCH_SIZE = 64
+# silhouette 是 O(N²)，选 k 时只在抽样上评估
+SILHOUETTE_SAMPLE_SIZE = 500
+
+
+def _paper_text(p: dict[str, Any]) -> str:
+    return f"{p.get('abstract','')}\n{' '.join([str(k) for k in (p.get('keywords') or [])])}".strip()
+
+
+def _new_paper(paper_id: str, filename: str, parsed: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "id": paper_id,
+        **parsed,
+        "filename": filename,
+        # 初始化默认字段，防止缺少键值
+        "field": "Processing...",
+        "confidence": 0.0,
+        "cluster": 0,
+        "pos": [0.0, 0.0, 0.0],
+        "size": 3.0,
+    }
+
+
+def _text_hash(text: str, embed_model: str) -> str:
+    # 模型标识也参与哈希：同一文本在不同模型下是不同的缓存键，别的模型的向量不会被当成命中
+    return hashlib.blake2s(f"{embed_model}\n{text}".encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _cluster_and_layout(
+    vectors: np.ndarray, vectors_norm: np.ndarray, vectors_i8: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """聚类 + 置信度 + 3D 布局，返回 (clusters, confidences, coords)；纯计算，不访问 store 状态"""
+    n = vectors.shape[0]
+
+    # --- 聚类逻辑 (KMeans) ---
+    if n == 1:
+        clusters = np.array([0])
+        centers = vectors
+    else:
+        max_k = min(8, n)
+        candidate_ks = list(range(2, max_k + 1))
+
+        def _fit_score(k: int) -> tuple[float, MiniBatchKMeans, np.ndarray] | None:
+            try:
+                kmeans = MiniBatchKMeans(n_clusters=k, n_init=3, random_state=42, batch_size=min(1024, n))
+                labels = kmeans.fit_predict(vectors)
+            except Exception:
+                return None
+
+            uniq = np.unique(labels)
+            if uniq.size < 2 or uniq.size >= n:
+                return None
+
+            try:
+                # 单位向量上欧氏距离与余弦距离排序一致，走 sklearn 更快的欧氏路径
+                sil = float(
+                    silhouette_score(
+                        vectors_norm,
+                        labels,
+                        metric="euclidean",
+                        sample_size=min(n, SILHOUETTE_SAMPLE_SIZE),
+                        random_state=42,
+                    )
+                )
+            except Exception:
+                return None
+            return sil, kmeans, labels
+
+        # 各个 k 相互独立；KMeans 与 silhouette 的计算大多释放 GIL，用线程并行即可
+        results = Parallel(n_jobs=-1, prefer="threads")(delayed(_fit_score)(k) for k in candidate_ks)
+
+        # 简化评分逻辑，主要看 Silhouette；同分时取较小的 k
+        best_kmeans = None
+        best_clusters = None
+        best_key = None
+        for res in results:
+            if res is None:
+                continue
+            sil, kmeans, labels = res
+            if best_key is None or sil > best_key:
+                best_key = sil
+                best_kmeans = kmeans
+                best_clusters = labels
+
+        if best_kmeans is None or best_clusters is None:
+            # fallback
+            k = min(5, max(2, int(round(np.sqrt(n)))), n)
+            kmeans = KMeans(n_clusters=k, n_init="auto", random_state=42)
+            clusters = kmeans.fit_predict(vectors)
+            centers = kmeans.cluster_centers_
+        else:
+            clusters = best_clusters
+            centers = best_kmeans.cluster_centers_
+
+    # --- 置信度 ---
+    # 置信度 = 论文向量与所属簇中心的余弦相似度；有 SimSIMD 时用 int8 批量逐行计算，否则逐行点积
+    centers_norm = l2_normalize(centers)
+    if simsimd is not None:
+        centers_i8 = quantize_i8(centers_norm)
+        confidences = 1.0 - np.asarray(simsimd.cosine(vectors_i8, centers_i8[clusters]), dtype=np.float64)
+    else:
+        confidences = np.einsum("ij,ij->i", vectors_norm, centers_norm[clusters])
+    np.clip(confidences, 0.0, 1.0, out=confidences)
+
+    # --- 降维 (3D 坐标) ---
+    coords = reduce_to_3d(vectors)
+
+    # 简单的径向分离 (使聚类在空间上更开)
+    k_count = int(np.max(clusters)) + 1 if clusters.size else 1
+    if k_count > 1 and coords.shape[0] == clusters.shape[0]:
+        radius = 5.0
+        # 按簇排序后一次 reduceat 求出各簇质心（空簇保持 0，不会被索引到）
+        order = np.argsort(clusters, kind="stable")
+        cs = clusters[order]
+        starts = np.r_[0, np.flatnonzero(np.diff(cs)) + 1]
+        sums = np.add.reduceat(coords[order], starts, axis=0)
+        counts = np.diff(np.r_[starts, cs.size])
+        means = np.zeros((k_count, 3), dtype=np.float32)
+        means[cs[starts]] = sums / counts[:, None]
+        # 每簇向质心收缩后整体移向圆周
+        angles = 2.0 * np.pi * np.arange(k_count) / k_count
+        offsets = np.stack(
+            [np.cos(angles) * radius, np.zeros(k_count), np.sin(angles) * radius], axis=1
+        ).astype(np.float32)
+        coords = (coords - means[clusters]) * 0.6 + offsets[clusters]
+
+    return clusters, confidences, coords
 
 
 class ScholarStore:
     def __init__(self) -> None:
         self._lock = Lock()
+        self._model_lock = Lock()
         self._papers: list[dict[str, Any]] = []
         self._vectors: np.ndarray | None = None
+        # 归一化后的 float32 向量，供 /api/papers 计算边时复用
+        self._vectors_norm: np.ndarray | None = None
+        # int8 量化向量（每维 *127），带宽仅为 float32 的 1/4
+        self._vectors_i8: np.ndarray | None = None
+        # 文本哈希 -> 向量；文本未变的论文重算时无需再过模型，文本相同的论文共用一个向量
+        self._vec_by_hash: dict[str, np.ndarray] = {}
+        # (向量矩阵签名, 重算结果)；向量不变时跳过聚类 + 降维
+        self._layout_cache: tuple[bytes, tuple[np.ndarray, ...]] | None = None
+        # 连边由后台任务计算，/api/papers 只读取最近一次的快照（可能短暂过期）
+        self._edges: list[dict[str, Any]] | None = None
+        self._edges_dirty = True
+        self._data_version = 0
+        # 数据变化时的通知回调（由 API 层注册，用于唤醒后台连边任务）
+        self._edges_notify: Callable[[], None] | None = None
+        # /api/papers 响应体缓存（已编码的 JSON）
+        self._papers_bytes: bytes | None = None
+        # analyze / visualization 的返回结果缓存，重算时直接由结果数组生成
+        self._viz: dict[str, Any] | None = None
+        # filename -> safe_stem(filename)，文件名不变则结果不变，无需随 papers 失效
+        self._stem_cache: dict[str, str] = {}
         self._model = None
         self._model_name = os.getenv("SCHOLAR_ST_MODEL") or "all-MiniLM-L6-v2"
         self._offline = (os.getenv("SCHOLAR_OFFLINE") or "").strip().lower() in {"1", "true", "yes"}
+        self._st_backend = (os.getenv("SCHOLAR_ST_BACKEND") or "torch").strip().lower()
+        # 与向量一同持久化；换了模型或后端，旧向量就不能再与新编码的向量混用
+        self._embed_model = f"{self._st_backend}:{self._model_name}"
+        # 当前 _vectors 由哪个模型生成；旧版数据未记录时为 None
+        self._vectors_model: str | None = None
         
         # 初始化时尝试加载本地数据
         self._load_db()
 
     def _ensure_model(self):
-        if SentenceTransformer is None:
-            raise RuntimeError("sentence-transformers not installed")
+        # 重算的编码阶段不持有 _lock，用单独的锁避免并发重复加载模型
+        with self._model_lock:
+            return self._load_model_locked()
+
+    def _load_model_locked(self):
         if self._model is not None:
             return self._model
 
+        # ONNX Runtime + 动态 INT8 量化，CPU 上编码更快；加载失败时回退到 PyTorch
+        if self._st_backend == "onnx" and FastSentenceTransformer is not None:
+            try:
+                self._model = FastSentenceTransformer(self._model_name, device="cpu", quantize=True)
+                return self._model
+            except Exception as e:
+                print(f"Failed to load ONNX embedding model, falling back to PyTorch: {e}")
+
+        if SentenceTransformer is None:
+            raise RuntimeError("sentence-transformers not installed")
+
         try:
             if self._offline:
                 self._model = SentenceTransformer(self._model_name, local_files_only=True)
@@ -66,130 +244,147 @@ class ScholarStore:
         return self._model
 
     def _load_db(self) -> None:
-        """从本地 JSON 加载数据，恢复 papers 和 vectors"""
+        """从本地 JSON 加载 papers，从 .npy 加载 vectors（兼容旧版内嵌在 JSON 里的 vectors）"""
         if not PAPERS_JSON.exists():
             return
         
         try:
-            data = json.loads(PAPERS_JSON.read_text(encoding="utf-8"))
+            data = orjson.loads(PAPERS_JSON.read_bytes())
+            vectors = None
+            if VECTORS_NPY.exists():
+                vectors = np.load(VECTORS_NPY)
+            elif data.get("vectors"):
+                vectors = np.array(data["vectors"], dtype=np.float32)
+
             with self._lock:
                 self._papers = data.get("papers", [])
-                vectors_list = data.get("vectors", [])
                 
-                # 如果保存了向量，恢复为 numpy array
-                if vectors_list and len(vectors_list) == len(self._papers):
-                    self._vectors = np.array(vectors_list, dtype=np.float32)
+                # 记录的模型与当前配置不同：旧向量不可用，留空等待重算时全部重新编码
+                # 旧版数据没有 embed_model：向量照常用于连边和检索，但不进编码缓存，下次重算时重新编码
+                stored_model = data.get("embed_model")
+                if stored_model is not None and stored_model != self._embed_model:
+                    if vectors is not None:
+                        print(f"Embedding model changed ({stored_model} -> {self._embed_model}), vectors will be re-encoded")
+                    vectors = None
+                if vectors is not None and len(vectors) == len(self._papers):
+                    self._set_vectors_locked(vectors.astype(np.float32, copy=False))
+                    self._vectors_model = stored_model
+                    if stored_model is not None:
+                        # 每行向量按写入时记录的 text_hash 入缓存；缺少该字段时按当前文本计算
+                        self._vec_by_hash = {
+                            p.get("text_hash") or _text_hash(_paper_text(p), self._embed_model): self._vectors[i]
+                            for i, p in enumerate(self._papers)
+                        }
                 else:
-                    self._vectors = None
+                    self._set_vectors_locked(None)
+                self._invalidate_caches_locked()
             print(f"Loaded {len(self._papers)} papers from {PAPERS_JSON}")
         except Exception as e:
             print(f"Failed to load DB: {e}")
 
     def _save_db(self) -> None:
-        """将内存数据持久化到本地 JSON"""
+        """papers 写入 JSON，vectors 以原始 float32 写入相邻的 .npy"""
         try:
-            vectors_list = []
             if self._vectors is not None:
-                # Numpy array 无法直接序列化，需转为 list
-                vectors_list = self._vectors.tolist()
-            
-            data = {
-                "papers": self._papers,
-                "vectors": vectors_list
-            }
-            PAPERS_JSON.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+                # 先写临时文件再替换，避免中途失败留下半个文件
+                tmp = VECTORS_NPY.with_suffix(".tmp")
+                with tmp.open("wb") as f:
+                    np.save(f, self._vectors)
+                os.replace(tmp, VECTORS_NPY)
+            else:
+                VECTORS_NPY.unlink(missing_ok=True)
+
+            # orjson 直接输出 UTF-8 bytes，省去 str 中间结果和再编码；同样先写临时文件再替换
+            tmp = PAPERS_JSON.with_suffix(".tmp")
+            tmp.write_bytes(orjson.dumps({"embed_model": self._vectors_model, "papers": self._papers}, option=orjson.OPT_SERIALIZE_NUMPY))
+            os.replace(tmp, PAPERS_JSON)
         except Exception as e:
             print(f"Failed to save DB: {e}")
 
-    def add_pdf(self, filename: str, raw: bytes, recompute: bool = True) -> str:
+    def add_pdf(self, filename: str, src: Path, recompute: bool = True) -> str:
+        """把已落盘的上传文件 src 移动到 FILES_DIR（调用方交出所有权）"""
         paper_id = uuid.uuid4().hex[:10]
         pdf_path = FILES_DIR / f"{paper_id}.pdf"
-        pdf_path.write_bytes(raw)
-        
-        # 提取文本
+        shutil.move(str(src), str(pdf_path))
+
         try:
-            raw_text = read_pdf_text(pdf_path, max_pages=5)
-            cleaned = clean_text(raw_text)
-        except Exception as e:
+            parsed = parse_pdf(pdf_path, filename)
+        except Exception:
             # 删除损坏文件
-            if pdf_path.exists():
-                pdf_path.unlink()
-            raise ValueError(f"PDF parsing failed: {str(e)}")
-
-        # 校验：如果提取内容为空或太短，视为无效文件
-        if not cleaned or len(cleaned) < 50:
-            if pdf_path.exists():
-                pdf_path.unlink()
-            raise ValueError("No text extracted from PDF (file might be image-only or encrypted).")
-
-        display_title = safe_stem(filename)
-        title = extract_title_from_text(cleaned, display_title)
-        abstract = extract_abstract_block(cleaned)
-        
-        # 提取第一句话
-        first_sentence = ""
-        if cleaned:
-            import re
-            match = re.search(r'[^.!?。！？]+[.!?。！？]', cleaned)
-            if match:
-                first_sentence = match.group(0).strip()
-            else:
-                first_sentence = cleaned[:100].strip() + "..."
-        
-        keywords = extract_keywords_block(cleaned)
-        if not keywords:
-            keywords = tfidf_keywords_block(f"{title}\n{abstract}")
-            
-        paper = {
-            "id": paper_id,
-            "title": title,
-            "display_title": display_title,
-            "abstract": abstract,
-            "first_sentence": first_sentence,
-            "keywords": keywords,
-            "filename": filename,
-            # 初始化默认字段，防止缺少键值
-            "field": "Processing...",
-            "confidence": 0.0,
-            "cluster": 0,
-            "pos": [0.0, 0.0, 0.0],
-            "size": 3.0
-        }
-        
+            pdf_path.unlink(missing_ok=True)
+            raise
+
         with self._lock:
-            self._papers.append(paper)
-            if recompute:
-                self._recompute_locked()
-            else:
+            self._papers.append(_new_paper(paper_id, filename, parsed))
+            self._invalidate_caches_locked()
+            if not recompute:
                 # 如果不立即重算，也需要保存 papers 列表
                 self._save_db()
-                
+        if recompute:
+            self._recompute()
+
         return paper_id
 
     def ingest_from_inbox(self) -> int:
         if not INBOX_DIR.exists():
             return 0
 
-        count = 0
+        with os.scandir(INBOX_DIR) as it:
+            pdfs = [Path(e.path) for e in it if e.name.lower().endswith(".pdf") and e.is_file()]
         with self._lock:
             existing_filenames = {p.get("filename") for p in self._papers}
+        todo = [p for p in pdfs if p.name not in existing_filenames]
+        if not todo:
+            return 0
 
-        for pdf_path in INBOX_DIR.glob("*.pdf"):
-            if pdf_path.name in existing_filenames:
-                continue
+        # PDF 解析是 CPU 密集型且 pdfplumber 基本不释放 GIL，多个文件时放到进程池里并行解析
+        # 显式使用 spawn：本进程已加载 torch/sklearn 且是多线程的，fork 不安全
+        # 子进程只导入 text_processing（两个入口 main:app / server.py 都不会在子进程里构建 ScholarStore）
+        pool = None
+        futures = None
+        if len(todo) > 1:
             try:
-                raw = pdf_path.read_bytes()
-                # 注意：这里会抛出 ValueError，需要捕获
-                self.add_pdf(pdf_path.name, raw, recompute=False)
-                count += 1
-                print(f"Ingested: {pdf_path.name}")
+                pool = ProcessPoolExecutor(
+                    max_workers=min(len(todo), os.cpu_count() or 1),
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                futures = [pool.submit(parse_pdf, p, p.name) for p in todo]
             except Exception as e:
-                print(f"Error ingesting {pdf_path.name}: {e}")
+                print(f"Failed to start PDF parsing pool, parsing serially: {e}")
+                futures = None
 
-        if count > 0:
-            with self._lock:
-                self._recompute_locked()
-        return count
+        new_papers: list[dict[str, Any]] = []
+        try:
+            for i, pdf_path in enumerate(todo):
+                try:
+                    try:
+                        parsed = futures[i].result() if futures else parse_pdf(pdf_path, pdf_path.name)
+                    except BrokenProcessPool:
+                        # 进程池本身挂了（子进程被杀等），改为在本进程里解析，而不是丢弃剩余文件
+                        parsed = parse_pdf(pdf_path, pdf_path.name)
+                    paper_id = uuid.uuid4().hex[:10]
+                    shutil.copyfile(pdf_path, FILES_DIR / f"{paper_id}.pdf")
+                    new_papers.append(_new_paper(paper_id, pdf_path.name, parsed))
+                    print(f"Ingested: {pdf_path.name}")
+                except Exception as e:
+                    print(f"Error ingesting {pdf_path.name}: {e}")
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        # 所有新论文一次性入库，最后只重算一次；解析期间可能有并发的导入已加入同名文件，入库前在锁内再查一次
+        with self._lock:
+            existing_filenames = {p.get("filename") for p in self._papers}
+            added = [p for p in new_papers if p["filename"] not in existing_filenames]
+            if added:
+                self._papers.extend(added)
+                self._invalidate_caches_locked()
+        for p in new_papers:
+            if p["filename"] in existing_filenames:
+                (FILES_DIR / f"{p['id']}.pdf").unlink(missing_ok=True)
+        if added:
+            self._recompute()
+        return len(added)
 
     def list_pdfs(self) -> list[dict[str, Any]]:
         # 这里的 list_pdfs 主要是简单的列表返回，
@@ -201,117 +396,125 @@ class ScholarStore:
         return out
 
     def analyze(self) -> dict[str, Any]:
+        self._recompute()
         with self._lock:
-            self._recompute_locked()
             return self._visualization_locked()
 
     def visualization(self) -> dict[str, Any]:
         with self._lock:
             return self._visualization_locked()
 
-    def _recompute_locked(self) -> None:
-        if not self._papers:
-            self._vectors = None
-            self._save_db()
-            return
-            
-        model = self._ensure_model()
-        texts = [
-            f"{p.get('abstract','')}\n{' '.join([str(k) for k in (p.get('keywords') or [])])}".strip()
-            for p in self._papers
-        ]
-        
-        # 计算向量
-        vectors = model.encode(texts, normalize_embeddings=True)
-        self._vectors = np.array(vectors, dtype=np.float32)
-        n = len(self._papers)
-
-        # --- 聚类逻辑 (KMeans) ---
-        if n == 1:
-            clusters = np.array([0])
-            centers = self._vectors.copy()
+    def _invalidate_caches_locked(self) -> None:
+        """papers 或 vectors 发生变化时调用，丢弃所有派生缓存"""
+        self._papers_bytes = None
+        self._viz = None
+        self._data_version += 1
+        self._edges_dirty = True
+        if self._edges_notify is not None:
+            self._edges_notify()
+
+    def _set_vectors_locked(self, vectors: np.ndarray | None) -> None:
+        self._vectors = vectors
+        if vectors is None:
+            self._vectors_norm = None
+            self._vectors_i8 = None
         else:
-            max_k = min(8, n)
-            candidate_ks = list(range(2, max_k + 1))
-            best_kmeans = None
-            best_clusters = None
-            best_key = None
-
-            for k in candidate_ks:
-                try:
-                    kmeans = KMeans(n_clusters=k, n_init="auto", random_state=42)
-                    labels = kmeans.fit_predict(self._vectors)
-                except Exception:
-                    continue
+            self._vectors_norm = l2_normalize(vectors)
+            self._vectors_i8 = quantize_i8(self._vectors_norm)
+
+    @staticmethod
+    def _encode_sorted(model, texts: list[str]) -> np.ndarray:
+        """按文本长度排序后分批编码，再按原顺序还原"""
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        emb = model.encode(
+            [texts[i] for i in order],
+            batch_size=ENCODE_BATCH_SIZE,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        vectors = np.empty_like(emb)
+        vectors[order] = emb
+        return vectors
+
+    def _recompute(self) -> None:
+        """三段式重算：加锁取快照 -> 无锁编码/聚类/降维 -> 加锁校验版本后写回；期间数据有变化则重来"""
+        while True:
+            with self._lock:
+                version = self._data_version
+                texts = [_paper_text(p) for p in self._papers]
+                cached = dict(self._vec_by_hash)
+                layout_cache = self._layout_cache
+
+            hashes = [_text_hash(t, self._embed_model) for t in texts]
+            vec_by_hash = {h: cached[h] for h in hashes if h in cached}
+            result = None
+            if texts:
+                # 计算向量：只编码缓存里没有的文本（同一文本只编码一次）
+                missing = {h: t for h, t in zip(hashes, texts) if h not in vec_by_hash}
+                if missing:
+                    model = self._ensure_model()
+                    encoded = self._encode_sorted(model, list(missing.values()))
+                    vec_by_hash.update(zip(missing.keys(), encoded))
+                vectors = np.stack([vec_by_hash[h] for h in hashes]).astype(np.float32, copy=False)
+                # 向量矩阵与上次完全相同（只有元数据变化）时，直接复用上次的聚类和布局
+                sig = hashlib.blake2s(vectors.tobytes(), digest_size=16).digest()
+                if layout_cache is not None and layout_cache[0] == sig:
+                    result = layout_cache[1]
+                else:
+                    vectors_norm = l2_normalize(vectors)
+                    vectors_i8 = quantize_i8(vectors_norm)
+                    result = (vectors, vectors_norm, vectors_i8, *_cluster_and_layout(vectors, vectors_norm, vectors_i8))
 
-                uniq = np.unique(labels)
-                if uniq.size < 2 or uniq.size >= n:
+            with self._lock:
+                if self._data_version != version:
+                    # 计算期间论文有增改，结果已过期；保留已编码的向量，按新数据重来
+                    self._vec_by_hash.update(vec_by_hash)
                     continue
+                # 只保留当前论文用到的向量，避免缓存随文本修改无限增长
+                self._vec_by_hash = vec_by_hash
+                self._layout_cache = (sig, result) if result is not None else None
+                self._apply_recompute_locked(hashes, result)
+                return
+
+    def _apply_recompute_locked(self, hashes: list[str], result: tuple[np.ndarray, ...] | None) -> None:
+        self._invalidate_caches_locked()
+        if result is None:
+            self._set_vectors_locked(None)
+            self._vectors_model = None
+            self._save_db()
+            return
 
-                sil = None
-                try:
-                    sil = float(silhouette_score(self._vectors, labels, metric="cosine"))
-                except Exception:
-                    pass
-
-                if sil is None:
-                    continue
-                
-                # 简化评分逻辑，主要看 Silhouette
-                key = sil
-                if best_key is None or key > best_key:
-                    best_key = key
-                    best_kmeans = kmeans
-                    best_clusters = labels
-
-            if best_kmeans is None or best_clusters is None:
-                # fallback
-                k = min(5, max(2, int(round(np.sqrt(n)))), n)
-                kmeans = KMeans(n_clusters=k, n_init="auto", random_state=42)
-                clusters = kmeans.fit_predict(self._vectors)
-                centers = kmeans.cluster_centers_
-            else:
-                clusters = best_clusters
-                centers = best_kmeans.cluster_centers_
+        vectors, vectors_norm, vectors_i8, clusters, confidences, coords = result
+        self._vectors, self._vectors_norm, self._vectors_i8 = vectors, vectors_norm, vectors_i8
+        self._vectors_model = self._embed_model
 
-        # --- 更新论文属性 ---
+        # 每个簇的颜色和名称只算一次，逐篇论文直接按簇号取
+        k_count = int(np.max(clusters)) + 1 if clusters.size else 1
         palette = cluster_palette()
-        for i, p in enumerate(self._papers):
-            cid = int(clusters[i])
+        colors = [palette[c % len(palette)] for c in range(k_count)]
+        fields = [f"Topic {c + 1}" for c in range(k_count)]  # 简化命名
+        cluster_ids = clusters.tolist()
+        positions = coords.tolist()
+        for p, h, cid, conf, pos in zip(self._papers, hashes, cluster_ids, confidences.tolist(), positions):
+            p["text_hash"] = h
             p["cluster"] = cid
-            p["field"] = f"Topic {cid + 1}" # 简化命名
-            p["color"] = palette[cid % len(palette)]
-            
-            center = centers[cid] if centers is not None else self._vectors[i]
-            v = np.asarray(self._vectors[i], dtype=np.float32).reshape(1, -1)
-            c = np.asarray(center, dtype=np.float32).reshape(1, -1)
-            sim = float(cosine_similarity(v, c)[0, 0])
-            p["confidence"] = max(0.0, min(1.0, sim))
-
-        # --- 降维 (3D 坐标) ---
-        coords = reduce_to_3d(self._vectors)
-        
-        # 简单的径向分离 (使聚类在空间上更开)
-        k_count = int(np.max(clusters)) + 1 if clusters.size else 1
-        if k_count > 1 and coords.shape[0] == clusters.shape[0]:
-            tightened = coords.astype(np.float32, copy=True)
-            radius = 5.0
-            for cid in range(k_count):
-                idx = np.where(clusters == cid)[0]
-                if idx.size == 0:
-                    continue
-                # 将该簇向中心收缩
-                center_mass = tightened[idx].mean(axis=0, keepdims=True)
-                tightened[idx] = (tightened[idx] - center_mass) * 0.6
-                # 将该簇整体移向圆周
-                angle = float(2.0 * np.pi * (cid / k_count))
-                offset = np.array([np.cos(angle) * radius, 0.0, np.sin(angle) * radius], dtype=np.float32)
-                tightened[idx] = tightened[idx] + offset
-            coords = tightened
-
-        for i, p in enumerate(self._papers):
-            p["pos"] = [float(coords[i, 0]), float(coords[i, 1]), float(coords[i, 2])]
-            p["size"] = float(3.0 + (p.get("confidence", 0.0) * 5.0))
+            p["field"] = fields[cid]
+            p["color"] = colors[cid]
+            p["confidence"] = conf
+            p["pos"] = pos
+            p["size"] = 3.0 + conf * 5.0
+
+        # 节点和簇统计直接由结果数组生成，不必再逐篇 get 取值
+        nodes = [
+            {"id": p["id"], "x": x, "y": y, "z": z, "field": fields[cid]}
+            for p, (x, y, z), cid in zip(self._papers, positions, cluster_ids)
+        ]
+        uniq, first = np.unique(clusters, return_index=True)
+        counts = np.bincount(clusters, minlength=k_count)
+        # 与逐篇统计一致：簇按首次出现的顺序排列
+        order = uniq[np.argsort(first)].tolist()
+        self._viz = {"nodes": nodes, "fields": [{"name": fields[c], "count": int(counts[c])} for c in order]}
 
         # 计算完成后保存到磁盘
         self._save_db()
@@ -319,6 +522,9 @@ class ScholarStore:
     def _visualization_locked(self) -> dict[str, Any]:
         # 该方法可以复用 api.py 中的逻辑，或者保持现状
         # 为了避免 api.py 和 store.py 逻辑重复，这里仅返回基础结构，主要由 api 组装
+        # 重算后已缓存；这里只处理从磁盘加载、尚未重算过的数据
+        if self._viz is not None:
+            return self._viz
         nodes = []
         fields_map = {}
         for p in self._papers:
@@ -336,12 +542,13 @@ class ScholarStore:
                 fields_map[cid] = {"name": field_name, "count": 0}
             fields_map[cid]["count"] += 1
             
-        return {"nodes": nodes, "fields": list(fields_map.values())}
+        self._viz = {"nodes": nodes, "fields": list(fields_map.values())}
+        return self._viz
     
     #  新增：语义搜索功能
     def search_similar_papers(self, query: str, top_k: int = 3) -> list[dict[str, Any]]:
         """根据用户问题，检索最相关的论文及其摘要"""
-        if not self._papers or self._vectors is None:
+        if not self._papers or self._vectors_norm is None:
             return []
 
         with self._lock:
@@ -349,16 +556,15 @@ class ScholarStore:
             model = self._ensure_model()
             query_vector = model.encode([query], normalize_embeddings=True)
 
-            # 2. 计算余弦相似度
-            # self._vectors 形状是 (N, Dim), query_vector 形状是 (1, Dim)
-            sims = cosine_similarity(query_vector, self._vectors)[0]
+            # 2. 计算余弦相似度：两侧都已归一化，直接做矩阵-向量乘
+            # self._vectors_norm 形状是 (N, Dim), query_vector 形状是 (1, Dim)
+            sims = self._vectors_norm @ l2_normalize(query_vector)[0]
 
             # 3. 获取相似度最高的前 K 个索引
-            top_indices = np.argsort(sims)[::-1][:top_k]
+            top_scores, top_indices = top_k_desc(sims, top_k)
 
             results = []
-            for idx in top_indices:
-                score = float(sims[idx])
+            for score, idx in zip(top_scores.tolist(), top_indices.tolist()):
                 # 只有相关度大于 0.2 的才作为参考，避免强行回答
                 if score > 0.2:
                     paper = self._papers[idx]
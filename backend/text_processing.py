@@ -1,10 +1,10 @@
 from __future__ import annotations
 
+import os
 import re
+from collections import Counter
 from pathlib import Path
-
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
+from typing import Any
 
 try:
     import pdfplumber
@@ -17,6 +17,18 @@ except ImportError:
     fitz = None
 
 
+_PDF_BACKEND = (os.getenv("SCHOLAR_PDF_BACKEND") or "fitz").strip().lower()
+
+_WS_RE = re.compile(r"[ \t]+")
+_MULTI_NL_RE = re.compile(r"\n{3,}")
+_MULTI_SPACE_RE = re.compile(r"[^\S\r\n]{2,}")
+_ABSTRACT_RE = re.compile(r"(abstract|摘要)[:：]?\s*", re.IGNORECASE)
+_ABSTRACT_STOP_RE = re.compile(r"\n\s*(introduction|1\s+introduction|关键词|keywords)[:：]?\s*", re.IGNORECASE)
+_KEYWORDS_RE = re.compile(r"(keywords|关键词)[:：]\s*(.+)", re.IGNORECASE)
+_KW_SPLIT_RE = re.compile(r"[;,，、\n]")
+_FIRST_SENT_RE = re.compile(r"[^.!?。！？]+[.!?。！？]")
+
+
 def safe_stem(filename: str) -> str:
     name = filename.rsplit("\\", 1)[-1].rsplit("/", 1)[-1]
     if name.lower().endswith(".pdf"):
@@ -24,31 +36,42 @@ def safe_stem(filename: str) -> str:
     return name.strip() or "Untitled"
 
 
-def read_pdf_text(pdf_path: Path, max_pages: int = 5) -> str:
-    if pdfplumber is not None:
-        parts: list[str] = []
-        with pdfplumber.open(str(pdf_path)) as pdf:
-            pages = pdf.pages[:max_pages] if max_pages else pdf.pages
-            for page in pages:
-                parts.append(page.extract_text() or "")
-        return "\n".join(parts)
-    if fitz is not None:
-        doc = fitz.open(str(pdf_path))
-        parts = []
+def _read_with_fitz(pdf_path: Path, max_pages: int) -> str:
+    doc = fitz.open(str(pdf_path))
+    try:
         page_count = min(doc.page_count, max_pages or doc.page_count)
-        for i in range(page_count):
-            parts.append(doc.load_page(i).get_text("text") or "")
+        parts = [doc.load_page(i).get_text("text") or "" for i in range(page_count)]
+    finally:
         doc.close()
-        return "\n".join(parts)
+    return "\n".join(parts)
+
+
+def _read_with_pdfplumber(pdf_path: Path, max_pages: int) -> str:
+    parts: list[str] = []
+    with pdfplumber.open(str(pdf_path)) as pdf:
+        pages = pdf.pages[:max_pages] if max_pages else pdf.pages
+        for page in pages:
+            parts.append(page.extract_text() or "")
+    return "\n".join(parts)
+
+
+def read_pdf_text(pdf_path: Path, max_pages: int = 5) -> str:
+    # 默认优先 PyMuPDF（C 实现，比 pdfplumber/pdfminer 快得多）；需要 pdfplumber 时用 SCHOLAR_PDF_BACKEND 指定
+    readers = [(fitz, _read_with_fitz), (pdfplumber, _read_with_pdfplumber)]
+    if _PDF_BACKEND == "pdfplumber":
+        readers.reverse()
+    for module, reader in readers:
+        if module is not None:
+            return reader(pdf_path, max_pages)
     raise RuntimeError("No PDF parser available")
 
 
 def clean_text(text: str) -> str:
     t = text or ""
     t = t.replace("\x00", " ")
-    t = re.sub(r"[ \t]+", " ", t)
-    t = re.sub(r"\n{3,}", "\n\n", t)
-    t = re.sub(r"[^\S\r\n]{2,}", " ", t)
+    t = _WS_RE.sub(" ", t)
+    t = _MULTI_NL_RE.sub("\n\n", t)
+    t = _MULTI_SPACE_RE.sub(" ", t)
     return t.strip()
 
 
@@ -62,33 +85,71 @@ def extract_title_from_text(text: str, fallback: str) -> str:
 
 def extract_abstract_block(text: str, limit: int = 1200) -> str:
     t = text or ""
-    m = re.search(r"(abstract|摘要)[:：]?\s*", t, re.IGNORECASE)
+    m = _ABSTRACT_RE.search(t)
     if not m:
         return t[:limit].strip()
     tail = t[m.end() :]
-    stop = re.search(r"\n\s*(introduction|1\s+introduction|关键词|keywords)[:：]?\s*", tail, re.IGNORECASE)
+    stop = _ABSTRACT_STOP_RE.search(tail)
     if stop:
         tail = tail[: stop.start()]
     return tail.strip()[:limit]
 
 
+def extract_first_sentence(text: str, limit: int = 100) -> str:
+    if not text:
+        return ""
+    m = _FIRST_SENT_RE.search(text)
+    if m:
+        return m.group(0).strip()
+    return text[:limit].strip() + "..."
+
+
 def extract_keywords_block(text: str, top_k: int = 8) -> list[str]:
     t = text or ""
-    m = re.search(r"(keywords|关键词)[:：]\s*(.+)", t, re.IGNORECASE)
+    m = _KEYWORDS_RE.search(t)
     if m:
         raw = m.group(2)
-        parts = re.split(r"[;,，、\n]", raw)
+        parts = _KW_SPLIT_RE.split(raw)
         kws = [p.strip() for p in parts if p.strip()]
         return kws[:top_k]
     return []
 
 
+# 与 TfidfVectorizer 默认的 token_pattern 一致
+_TOKEN_RE = re.compile(r"(?u)\b\w\w+\b")
+
+
 def tfidf_keywords_block(text: str, top_k: int = 8) -> list[str]:
-    if not text.strip():
+    # 单篇文档时 IDF 恒为 1，TF-IDF 退化为词频，直接计数 unigram + bigram 即可，无需构建 TfidfVectorizer
+    tokens = _TOKEN_RE.findall(text.lower())
+    if not tokens:
         return []
-    vectorizer = TfidfVectorizer(max_features=2000, ngram_range=(1, 2))
-    X = vectorizer.fit_transform([text])
-    row = X.toarray().ravel()
-    feats = vectorizer.get_feature_names_out()
-    idx = np.argsort(row)[::-1][:top_k]
-    return [str(feats[i]) for i in idx if row[i] > 0]
+    cnt = Counter(tokens)
+    cnt.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    return [w for w, _ in cnt.most_common(top_k)]
+
+
+def parse_pdf(pdf_path: Path, filename: str) -> dict[str, Any]:
+    """解析 PDF 并抽取论文元数据；只做纯计算，可在子进程中运行"""
+    try:
+        cleaned = clean_text(read_pdf_text(pdf_path, max_pages=5))
+    except Exception as e:
+        raise ValueError(f"PDF parsing failed: {str(e)}")
+
+    # 校验：如果提取内容为空或太短，视为无效文件
+    if not cleaned or len(cleaned) < 50:
+        raise ValueError("No text extracted from PDF (file might be image-only or encrypted).")
+
+    display_title = safe_stem(filename)
+    title = extract_title_from_text(cleaned, display_title)
+    abstract = extract_abstract_block(cleaned)
+    keywords = extract_keywords_block(cleaned)
+    if not keywords:
+        keywords = tfidf_keywords_block(f"{title}\n{abstract}")
+    return {
+        "title": title,
+        "display_title": display_title,
+        "abstract": abstract,
+        "first_sentence": extract_first_sentence(cleaned),
+        "keywords": keywords,
+    }
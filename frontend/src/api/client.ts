@@ -24,13 +24,48 @@ export async function uploadPdf(file: File): Promise<void> {
   if (!r.ok) throw new Error(`POST /api/papers/upload failed: ${r.status}`);
 }
 
-export async function queryLocal(prompt: string): Promise<QueryResponse> {
+// 后端以 Server-Sent Events 流式返回：cites / delta / error / done，data 均为 JSON
+export async function queryLocal(prompt: string, onDelta?: (text: string) => void): Promise<QueryResponse> {
   const r = await fetch(apiUrl('/api/query'), {
     method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
+    headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
     // ⚠️ CRITICAL CHANGE: 后端 api.py 中的 ChatBody 定义字段为 'question'，必须匹配
     body: JSON.stringify({ question: prompt }),
   });
-  if (!r.ok) throw new Error(`POST /api/query failed: ${r.status}`);
-  return r.json();
+  if (!r.ok || !r.body) throw new Error(`POST /api/query failed: ${r.status}`);
+
+  let answer = '';
+  let cites: string[] = [];
+  const reader = r.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buf += decoder.decode(value, { stream: true });
+    let sep: number;
+    while ((sep = buf.indexOf('\n\n')) >= 0) {
+      const block = buf.slice(0, sep);
+      buf = buf.slice(sep + 2);
+      let event = 'message';
+      let data = '';
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      }
+      if (!data) continue;
+      const payload = JSON.parse(data);
+      if (event === 'cites') {
+        cites = payload as string[];
+      } else if (event === 'delta') {
+        answer += payload as string;
+        onDelta?.(answer);
+      } else if (event === 'error') {
+        answer = payload as string;
+        cites = [];
+        onDelta?.(answer);
+      }
+    }
+  }
+  return { answer, cites };
 }
\ No newline at end of file
@@ -68,17 +68,22 @@ export function App() {
     setLoading(true);
 
     try {
-      // 调用 client.ts 中的 queryLocal (它会请求后端 api.py)
-      const res = await queryLocal(msg);
-      
+      // 调用 client.ts 中的 queryLocal (它会请求后端 api.py)，回答以流的形式逐段到达
+      let streaming = false;
+      const res = await queryLocal(msg, (partial) => {
+        const replaceLast = streaming;
+        streaming = true;
+        setChat((prev) => [...(replaceLast ? prev.slice(0, -1) : prev), { role: 'ai', text: partial }]);
+      });
+
       const answer = res.answer || 'AI 未返回内容';
       // 兼容两种引用格式：后端返回的 cites 数组 或 文本中的 [CITE:id] 标记
       const cites =
         res.cites ||
         answer.match(/\[CITE:(\w+)\]/g)?.map((c) => c.replace('[CITE:', '').replace(']', '')) ||
         [];
-        
-      setChat((prev) => [...prev, { role: 'ai', text: answer, cites }]);
+
+      setChat((prev) => [...(streaming ? prev.slice(0, -1) : prev), { role: 'ai', text: answer, cites }]);
     } catch (err) {
       console.error(err);
       setChat((prev) => [...prev, { role: 'ai', text: '❌ 检索失败：请检查后端连接或 API Key 配置。' }]);